@@ -0,0 +1,435 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+# ------------------------------
+# EXPORT CONFIGURATION
+# ------------------------------
+DB_PATH = "cinema.db"
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+CHUNK_SIZE = 1000          # rows fetched per keyset page
+ROWS_PER_FILE = 100_000    # rows per partition file
+THROTTLE_SECONDS = 0.05    # pause between pages so the bot can grab the write lock
+
+# table -> (key column, incremental?)
+# `users` is rewritten in place by INSERT OR REPLACE, so a high-water mark
+# would miss XP updates; it is always exported as a full snapshot.
+# `recommendations` is likewise changed in place by /rate and pruned by
+# /removerecommendations, so it is always a full snapshot too.
+EXPORT_TABLES = {
+    "ray_memory": ("id", True),
+    "users": ("user_id", False),
+    "recommendations": ("id", False),
+    "scheduled_events": ("id", True),
+}
+
+# Output is Parquet when pyarrow is installed, otherwise gzip CSV. pyarrow is
+# imported lazily so the bot itself never needs it.
+FORMATS = ("parquet", "csv")
+NULL_TOKEN = r"\N"         # CSV only: marks NULL so it can't be confused with ''
+
+STATE_FILE = "state.json"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+STAGING_DIR = "_staging"    # outside the run=* namespace so globs never see partial runs
+
+
+class ExportInProgress(RuntimeError):
+    """Raised when another process already holds the export lock."""
+
+
+def connect_readonly(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """Open cinema.db read-only so the export can never take a write lock."""
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+
+
+def load_state(export_dir: str) -> dict:
+    """Return the stored high-water marks, keyed by table name."""
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(export_dir: str, state: dict):
+    path = os.path.join(export_dir, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def acquire_lock(export_dir: str):
+    """Take an exclusive lock on `export_dir/.lock` shared by the bot and the CLI."""
+    # Imported here so main.py still starts on platforms without fcntl (Windows).
+    import fcntl
+
+    lock_file = open(os.path.join(export_dir, LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise ExportInProgress("Another export is already running")
+    return lock_file
+
+
+def check_limits(chunk_size, rows_per_file, throttle):
+    """Reject sizes that would stall the export or defeat its bounded memory."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if rows_per_file < 1:
+        raise ValueError("rows_per_file must be at least 1")
+    if throttle < 0:
+        raise ValueError("throttle must not be negative")
+
+
+def table_exists(db: sqlite3.Connection, table: str) -> bool:
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def iter_chunks(db, table, key, after, upper, chunk_size=CHUNK_SIZE, throttle=THROTTLE_SECONDS):
+    """Yield (columns, rows) pages of `table` with `after` < key <= `upper`.
+
+    Each page is a separate short read, fully fetched before the next one,
+    so the shared lock is released between pages and on_message can commit.
+    """
+    while True:
+        cur = db.execute(
+            f"SELECT * FROM {table} WHERE {key} > ? AND {key} <= ? ORDER BY {key} LIMIT ?",
+            (after, upper, chunk_size)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return
+        columns = [d[0] for d in cur.description]
+        yield columns, rows
+        after = rows[-1][columns.index(key)]
+        if len(rows) < chunk_size:
+            return
+        if throttle:
+            time.sleep(throttle)
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_pyarrow():
+    """Return pyarrow with its parquet module loaded, or None if it isn't installed."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def resolve_format(output_format):
+    """Pick the output format, defaulting to Parquet whenever pyarrow is available."""
+    if output_format is None:
+        return "parquet" if load_pyarrow() else "csv"
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {output_format}")
+    if output_format == "parquet" and not load_pyarrow():
+        raise ValueError("Parquet export needs pyarrow installed")
+    return output_format
+
+
+def table_columns(db, table):
+    """Return [(name, declared type)] for `table`, in SELECT * order."""
+    return [(row[1], row[2]) for row in db.execute(f"PRAGMA table_info({table})")]
+
+
+def arrow_type(pa, declared):
+    """Map a declared SQLite column type to an Arrow type using SQLite's affinity rules."""
+    declared = declared.upper()
+    if "INT" in declared:
+        return pa.int64()
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+
+class CsvPartWriter:
+    extension = ".csv.gz"
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows([NULL_TOKEN if value is None else value for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetPartWriter:
+    extension = ".parquet"
+
+    def __init__(self, path, columns):
+        self.pa = load_pyarrow()
+        self.schema = self.pa.schema([(name, arrow_type(self.pa, declared)) for name, declared in columns])
+        self.writer = self.pa.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        arrays = []
+        for i, field in enumerate(self.schema):
+            values = [row[i] for row in rows]
+            if field.type == self.pa.string():
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(self.pa.array(values, type=field.type))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+PART_WRITERS = {"parquet": ParquetPartWriter, "csv": CsvPartWriter}
+
+
+def export_table(db, table, key, after, upper, table_dir, output_format="csv",
+                 chunk_size=CHUNK_SIZE, rows_per_file=ROWS_PER_FILE, throttle=THROTTLE_SECONDS):
+    """Stream one table into compressed partition files and return its manifest entry."""
+    os.makedirs(table_dir, exist_ok=True)
+    columns = table_columns(db, table)
+    key_index = [name for name, _ in columns].index(key)
+    writer_cls = PART_WRITERS[output_format]
+    files = []
+    total_rows = 0
+    first_key = None
+    last_key = None
+
+    part = None
+    part_path = None
+    part_rows = 0
+
+    def close_part():
+        part.close()
+        final_path = part_path[:-len(".tmp")]
+        os.replace(part_path, final_path)
+        files.append({
+            "path": os.path.relpath(final_path, os.path.dirname(table_dir)),
+            "rows": part_rows,
+            "sha256": file_sha256(final_path),
+        })
+
+    for _, rows in iter_chunks(db, table, key, after, upper, chunk_size, throttle):
+        if first_key is None:
+            first_key = rows[0][key_index]
+        last_key = rows[-1][key_index]
+
+        start = 0
+        while start < len(rows):
+            if part is None:
+                part_path = os.path.join(table_dir, f"part-{len(files):05d}{writer_cls.extension}.tmp")
+                part = writer_cls(part_path, columns)
+                part_rows = 0
+
+            batch = rows[start:start + rows_per_file - part_rows]
+            part.write(batch)
+            part_rows += len(batch)
+            total_rows += len(batch)
+            start += len(batch)
+
+            if part_rows >= rows_per_file:
+                close_part()
+                part = None
+
+    if part is not None:
+        close_part()
+
+    return {
+        "key": key,
+        "after": after,
+        "upper": upper,
+        "columns": [{"name": name, "type": declared} for name, declared in columns],
+        "min_key": first_key,
+        "max_key": last_key,
+        "row_count": total_rows,
+        "files": files,
+    }
+
+
+def run_export(db_path=DB_PATH, export_dir=EXPORT_DIR, incremental=True, tables=None, output_format=None,
+               chunk_size=CHUNK_SIZE, rows_per_file=ROWS_PER_FILE, throttle=THROTTLE_SECONDS):
+    """Export the activity tables to `export_dir/<run_id>/` and return the manifest.
+
+    With `incremental`, only rows above the stored high-water mark are exported
+    for tables that support it. The run is staged in `_staging/<run_id>/` and
+    only renamed into place once its manifest is written, and the mark is
+    advanced after that, so an interrupted run never shows up as a partition
+    and is simply redone next time.
+    """
+    check_limits(chunk_size, rows_per_file, throttle)
+    output_format = resolve_format(output_format)
+    tables = tables or list(EXPORT_TABLES)
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown export table(s): {', '.join(unknown)}")
+
+    os.makedirs(export_dir, exist_ok=True)
+    lock_file = acquire_lock(export_dir)
+    try:
+        return _run_export_locked(db_path, export_dir, incremental, tables, output_format,
+                                  chunk_size, rows_per_file, throttle)
+    finally:
+        lock_file.close()
+
+
+def _run_export_locked(db_path, export_dir, incremental, tables, output_format,
+                       chunk_size, rows_per_file, throttle):
+    # We hold the lock, so anything left in staging is from a killed run.
+    staging_root = os.path.join(export_dir, STAGING_DIR)
+    shutil.rmtree(staging_root, ignore_errors=True)
+
+    state = load_state(export_dir)
+    started = datetime.now(timezone.utc)
+    run_id = started.strftime("run=%Y%m%dT%H%M%S%fZ")
+    run_dir = os.path.join(export_dir, run_id)
+    staging_dir = os.path.join(staging_root, run_id)
+    os.makedirs(staging_dir)
+
+    manifest = {
+        "run_id": run_id,
+        "started_at": started.isoformat(),
+        "incremental": incremental,
+        "format": output_format,
+        "tables": {},
+    }
+    if output_format == "csv":
+        manifest["null_token"] = NULL_TOKEN
+
+    try:
+        db = connect_readonly(db_path)
+        try:
+            for table in tables:
+                key, supports_incremental = EXPORT_TABLES[table]
+                if not table_exists(db, table):
+                    print(f"⚠️ Skipping export of missing table {table}")
+                    continue
+
+                after = state.get(table, 0) if incremental and supports_incremental else 0
+                # Pin the upper bound up front so rows written during the export
+                # land in the next run instead of making counts drift.
+                upper = db.execute(f"SELECT MAX({key}) FROM {table}").fetchone()[0] or 0
+                mark_reset = upper < after
+                if mark_reset:
+                    # cinema.db was replaced or restored and its ids restarted below
+                    # the mark; an increment would skip every row up to the old mark.
+                    print(f"⚠️ {table}.{key} max {upper} is below the stored mark {after}; "
+                          f"falling back to a full export")
+                    after = 0
+
+                entry = export_table(
+                    db, table, key, after, upper, os.path.join(staging_dir, table), output_format,
+                    chunk_size, rows_per_file, throttle
+                )
+                entry["mode"] = "incremental" if after else "full"
+                entry["mark_reset"] = mark_reset
+
+                # Verify against the source before the mark can move past these rows.
+                entry["source_count"] = db.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE {key} > ? AND {key} <= ?", (after, upper)
+                ).fetchone()[0]
+                entry["verified"] = entry["row_count"] == entry["source_count"]
+                if not entry["verified"]:
+                    message = (f"{table}: exported {entry['row_count']} rows "
+                               f"but the source has {entry['source_count']}")
+                    if supports_incremental:
+                        raise RuntimeError(message)
+                    # Snapshot tables can lose rows to concurrent deletes; no mark depends on them.
+                    print(f"⚠️ Export row count mismatch for {message}")
+                manifest["tables"][table] = entry
+        finally:
+            db.close()
+
+        manifest["finished_at"] = datetime.now(timezone.utc).isoformat()
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging_dir, run_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    for table, entry in manifest["tables"].items():
+        if not EXPORT_TABLES[table][1]:
+            continue
+        if entry["mark_reset"]:
+            state[table] = entry["upper"]
+        else:
+            # Never move the mark backwards otherwise, e.g. if state.json was edited by hand.
+            state[table] = max(state.get(table, 0), entry["upper"])
+    save_state(export_dir, state)
+
+    return manifest
+
+
+# ------------------------------
+# CLI ENTRYPOINT
+# ------------------------------
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def non_negative_float(value):
+    number = float(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative, got {value}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export cinema.db activity tables to Parquet or gzip CSV partition files.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to cinema.db")
+    parser.add_argument("--out", default=EXPORT_DIR, help="Export directory")
+    parser.add_argument("--full", action="store_true", help="Ignore stored high-water marks and export everything")
+    parser.add_argument("--table", action="append", choices=list(EXPORT_TABLES), help="Table to export (repeatable)")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: parquet if pyarrow is installed, else csv)")
+    parser.add_argument("--chunk-size", type=positive_int, default=CHUNK_SIZE, help="Rows fetched per page")
+    parser.add_argument("--rows-per-file", type=positive_int, default=ROWS_PER_FILE, help="Rows per partition file")
+    parser.add_argument("--throttle", type=non_negative_float, default=THROTTLE_SECONDS,
+                        help="Seconds to sleep between pages (0 disables)")
+    args = parser.parse_args()
+
+    try:
+        manifest = run_export(
+            db_path=args.db,
+            export_dir=args.out,
+            incremental=not args.full,
+            tables=args.table,
+            output_format=args.format,
+            chunk_size=args.chunk_size,
+            rows_per_file=args.rows_per_file,
+            throttle=args.throttle,
+        )
+    except ExportInProgress as e:
+        parser.exit(1, f"⏳ {e}\n")
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"✅ Export {manifest['run_id']} ({manifest['format']}) written to {os.path.join(args.out, manifest['run_id'])}")
+    for table, entry in manifest["tables"].items():
+        print(f"  {table}: {entry['row_count']} rows ({entry['mode']}) in {len(entry['files'])} file(s)")
+
+
+if __name__ == "__main__":
+    main()
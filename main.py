@@ -10,6 +10,7 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 import requests
+from export import run_export, ExportInProgress, EXPORT_DIR, MANIFEST_FILE
 
 # ------------------------------
 # CONFIGURATION
@@ -624,6 +625,48 @@ async def moviechain(interaction: discord.Interaction, movie_name: str):
         f"🎬 **{verified_name}** accepted!\nNext movie should start with **{current_last_letter[guild_id].upper()}**!"
     )
 
+# ------------------------------
+# ANALYTICS EXPORT
+# ------------------------------
+@bot.tree.command(name="export_db", description="Export activity tables for offline analytics (bot owner only).")
+@app_commands.describe(full="Ignore the stored high-water mark and export every row")
+async def export_db(interaction: discord.Interaction, full: bool = False):
+    # The export covers every guild's data, so guild admin rights aren't enough.
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("❌ Only the bot owner can export the database.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    try:
+        # Runs in a worker thread on its own read-only connection,
+        # so on_message keeps handling XP and Ray memory meanwhile.
+        manifest = await asyncio.to_thread(run_export, incremental=not full)
+    except ExportInProgress:
+        await interaction.followup.send("⏳ An export is already running.", ephemeral=True)
+        return
+    except Exception as e:
+        print("Export error:", e)
+        await interaction.followup.send("❌ Export failed. Check the bot logs for details.", ephemeral=True)
+        return
+
+    run_dir = os.path.join(EXPORT_DIR, manifest["run_id"])
+    lines = [
+        f"**{table}**: {entry['row_count']} rows ({entry['mode']}, {len(entry['files'])} file(s))"
+        for table, entry in manifest["tables"].items()
+    ]
+    embed = discord.Embed(
+        title=f"📦 Export {manifest['run_id']}",
+        description="\n".join(lines) or "No tables exported.",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Location", value=f"`{os.path.abspath(run_dir)}`", inline=False)
+    await interaction.followup.send(
+        embed=embed,
+        file=discord.File(os.path.join(run_dir, MANIFEST_FILE)),
+        ephemeral=True
+    )
+
 # ------------------------------
 # WEB SERVER TO KEEP RAILWAY HAPPY
 # ------------------------------